@@ -4,56 +4,53 @@ Format JMH benchmark results in .NET BenchmarkDotNet style.
 Matches the format from Net.Zmq.Benchmarks-report-github.md
 """
 import json
+import math
+import statistics
 import sys
 import os
-
+from functools import lru_cache
+
+# orjson parses large JMH result files much faster; fall back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Shared default for missing metric entries (never mutated)
+EMPTY = {}
+
+# Unit tiers: (threshold, divisor, suffix), largest first; the last tier is the fallback
+SIZE_TIERS = [(1 << 30, 1 << 30, ' GB'), (1 << 20, 1 << 20, ' MB'), (1 << 10, 1 << 10, ' KB'), (0, 1, ' B')]
+BIT_RATE_TIERS = [(1e9, 1e9, ' Gbps'), (0, 1e6, ' Mbps')]
+BYTE_RATE_TIERS = [(1e9, 1e9, ' GB/s'), (0, 1e6, ' MB/s')]
+COUNT_TIERS = [(1e6, 1e6, 'M'), (1e3, 1e3, 'K'), (0, 1, '')]
+
+def format_tiered(value, tiers):
+    """Format a value using the first tier whose threshold it reaches"""
+    for threshold, divisor, suffix in tiers:
+        if value >= threshold:
+            break
+    return f"{value/divisor:.2f}{suffix}"
+
+@lru_cache(maxsize=256)
 def format_size(bytes_val):
     """Format bytes to human readable size"""
-    if bytes_val < 1024:
-        return f"{bytes_val:.2f} B"
-    elif bytes_val < 1024 * 1024:
-        return f"{bytes_val/1024:.2f} KB"
-    elif bytes_val < 1024 * 1024 * 1024:
-        return f"{bytes_val/(1024*1024):.2f} MB"
-    else:
-        return f"{bytes_val/(1024*1024*1024):.2f} GB"
+    return format_tiered(bytes_val, SIZE_TIERS)
 
 def format_throughput(msg_size, msg_per_sec):
     """Format data throughput like .NET: Mbps, Gbps, or GB/s"""
-    bits_per_sec = msg_size * 8 * msg_per_sec
-
     if msg_size <= 1500:  # Small messages: use bits
-        if bits_per_sec >= 1e9:
-            return f"{bits_per_sec/1e9:.2f} Gbps"
-        else:
-            return f"{bits_per_sec/1e6:.2f} Mbps"
+        return format_tiered(msg_size * 8 * msg_per_sec, BIT_RATE_TIERS)
     else:  # Large messages: use bytes
-        bytes_per_sec = msg_size * msg_per_sec
-        if bytes_per_sec >= 1e9:
-            return f"{bytes_per_sec/1e9:.2f} GB/s"
-        else:
-            return f"{bytes_per_sec/1e6:.2f} MB/s"
+        return format_tiered(msg_size * msg_per_sec, BYTE_RATE_TIERS)
 
 def format_messages_per_sec(count):
     """Format message rate like .NET: 3.07M, 908.96K, etc."""
-    if count >= 1e6:
-        return f"{count/1e6:.2f}M"
-    elif count >= 1e3:
-        return f"{count/1e3:.2f}K"
-    else:
-        return f"{count:.2f}"
-
-def format_number_compact(num):
-    """Format large numbers in compact form: 3.07M, 908.96K, etc."""
-    if num >= 1e6:
-        return f"{num/1e6:.2f}M"
-    elif num >= 1e3:
-        return f"{num/1e3:.2f}K"
-    else:
-        return f"{num:.2f}"
+    return format_tiered(count, COUNT_TIERS)
 
-def process_benchmark_type(data, benchmark_type):
+def process_benchmark_type(filtered_data, benchmark_type):
     """Process and display results for a specific benchmark type"""
+    out = []
 
     # Method display names (matching .NET)
     method_names = {
@@ -68,15 +65,6 @@ def process_benchmark_type(data, benchmark_type):
         'POLLER': 'Poller_RouterToRouter'
     }
 
-    # Filter benchmarks by type
-    filtered_data = []
-    for bench in data:
-        benchmark_name = bench['benchmark']
-        if benchmark_type == 'buffer' and 'MessageBufferStrategyBenchmark' in benchmark_name:
-            filtered_data.append(bench)
-        elif benchmark_type == 'receive' and 'ReceiveModeBenchmark' in benchmark_name:
-            filtered_data.append(bench)
-
     if not filtered_data:
         return
 
@@ -103,14 +91,14 @@ def process_benchmark_type(data, benchmark_type):
 
         # Calculate StdDev from raw data
         raw_data = bench['primaryMetric']['rawData'][0]
-        mean = sum(raw_data) / len(raw_data)
-        variance = sum((x - mean) ** 2 for x in raw_data) / len(raw_data)
-        stddev = variance ** 0.5
+        mean = statistics.fmean(raw_data)
+        stddev = math.sqrt(math.fsum((x - mean) ** 2 for x in raw_data) / len(raw_data))
 
         # GC metrics
-        gc_alloc_rate = bench.get('secondaryMetrics', {}).get('gc.alloc.rate', {}).get('score', 0)
-        gc_alloc_norm = bench.get('secondaryMetrics', {}).get('gc.alloc.rate.norm', {}).get('score', 0)
-        gc_count = bench.get('secondaryMetrics', {}).get('gc.count', {}).get('score', 0)
+        secondary = bench.get('secondaryMetrics', EMPTY)
+        gc_alloc_rate = secondary.get('gc.alloc.rate', EMPTY).get('score', 0)
+        gc_alloc_norm = secondary.get('gc.alloc.rate.norm', EMPTY).get('score', 0)
+        gc_count = secondary.get('gc.count', EMPTY).get('score', 0)
 
         key = (msg_size, name)
         results[key] = {
@@ -146,9 +134,9 @@ def process_benchmark_type(data, benchmark_type):
 
     # Print section header
     if benchmark_type == 'buffer':
-        print("\n## Message Buffer Strategy Benchmarks\n")
+        out.append("\n## Message Buffer Strategy Benchmarks\n")
     else:
-        print("\n## Receive Mode Benchmarks\n")
+        out.append("\n## Receive Mode Benchmarks\n")
 
     # Auto-detect methods from results
     all_methods = sorted(set(k[1] for k in results.keys()))
@@ -159,24 +147,26 @@ def process_benchmark_type(data, benchmark_type):
     else:
         method_order = all_methods
 
-    # ========================================
-    # Table 1: Main Performance Metrics (Compact)
-    # ========================================
-    print("### Performance Overview")
-    print()
-    print("| Method                   | Size    | Throughput | Msg/sec | Mean      | Ratio | Allocated | Alloc Ratio |")
-    print("|------------------------- |--------:|------------|--------:|----------:|------:|----------:|------------:|")
+    display_names = [method_names.get(m, m) for m in method_order]
+
+    # Compute every row once and buffer it for both tables
+    overview_rows = []
+    detail_rows = []
 
     for size_idx, size in enumerate(msg_sizes):
         baseline = baselines.get(size)
+        baseline_mean = baseline['mean'] if baseline else None
+        baseline_alloc = baseline['gc_alloc_norm'] if baseline else 0
+
+        # Compact size format
+        size_str = f"{size}B" if size < 1024 else f"{size//1024}KB"
 
-        for method_idx, method in enumerate(method_order):
+        for method, display_name in zip(method_order, display_names):
             key = (size, method)
             if key not in results:
                 continue
 
             r = results[key]
-            display_name = method_names.get(method, method)
 
             # Calculate metrics
             mean_ms = r['mean']
@@ -184,7 +174,7 @@ def process_benchmark_type(data, benchmark_type):
             # Ratio to baseline
             is_baseline = (method == baseline_name) if baseline_name else False
             if baseline and not is_baseline:
-                ratio = r['mean'] / baseline['mean']
+                ratio = mean_ms / baseline_mean
             else:
                 ratio = 1.0
 
@@ -200,44 +190,10 @@ def process_benchmark_type(data, benchmark_type):
 
             # Alloc ratio
             if baseline and not is_baseline:
-                alloc_ratio = r['gc_alloc_norm'] / baseline['gc_alloc_norm'] if baseline['gc_alloc_norm'] > 0 else 0
+                alloc_ratio = r['gc_alloc_norm'] / baseline_alloc if baseline_alloc > 0 else 0
             else:
                 alloc_ratio = 1.0
 
-            # Compact size format
-            size_str = f"{size}B" if size < 1024 else f"{size//1024}KB"
-
-            # Print row (compact format)
-            print(f"| {display_name:24} | {size_str:>7} | {throughput_str:>10} | {msg_per_sec_str:>7} | {mean_ms:>7.2f} ms | {ratio:>5.2f} | {allocated_str:>9} | {alloc_ratio:>10.2f} |")
-
-        # Add separator between message sizes (except after last)
-        if size_idx < len(msg_sizes) - 1:
-            print("|                          |         |            |         |           |       |           |             |")
-
-    print()
-
-    # ========================================
-    # Table 2: Detailed Metrics (Optional - can be toggled)
-    # ========================================
-    print("### Detailed Metrics")
-    print()
-    print("| Method                   | Size    | Score (ops/s) | Error      | StdDev    | Latency   | Gen0      |")
-    print("|------------------------- |--------:|--------------:|-----------:|----------:|----------:|----------:|")
-
-    for size_idx, size in enumerate(msg_sizes):
-        for method_idx, method in enumerate(method_order):
-            key = (size, method)
-            if key not in results:
-                continue
-
-            r = results[key]
-            display_name = method_names.get(method, method)
-
-            # Calculate metrics
-            mean_ms = r['mean']
-            error_ms = r['error']
-            stddev_ms = r['stddev']
-
             # Latency per message
             latency_ns = mean_ms * 1e6 / r['msg_count']
             if latency_ns < 1000:
@@ -248,51 +204,85 @@ def process_benchmark_type(data, benchmark_type):
             # GC Gen0 (collections per op)
             gen0_str = f"{r['gc_count']:.4f}" if r['gc_count'] > 0 else "-"
 
-            # JMH Score (ops/s)
-            score_ops = r['score']
-
-            # Compact size format
-            size_str = f"{size}B" if size < 1024 else f"{size//1024}KB"
-
-            # Print row
-            print(f"| {display_name:24} | {size_str:>7} | {score_ops:>12.2f} | {error_ms:>8.4f} ms | {stddev_ms:>8.4f} ms | {latency_str:>9} | {gen0_str:>9} |")
+            # Buffer one row per table
+            overview_rows.append(f"| {display_name:24} | {size_str:>7} | {throughput_str:>10} | {msg_per_sec_str:>7} | {mean_ms:>7.2f} ms | {ratio:>5.2f} | {allocated_str:>9} | {alloc_ratio:>10.2f} |")
+            detail_rows.append(f"| {display_name:24} | {size_str:>7} | {r['score']:>12.2f} | {r['error']:>8.4f} ms | {r['stddev']:>8.4f} ms | {latency_str:>9} | {gen0_str:>9} |")
 
         # Add separator between message sizes (except after last)
         if size_idx < len(msg_sizes) - 1:
-            print("|                          |         |               |            |           |           |           |")
+            overview_rows.append("|                          |         |            |         |           |       |           |             |")
+            detail_rows.append("|                          |         |               |            |           |           |           |")
 
-    print()
+    # ========================================
+    # Table 1: Main Performance Metrics (Compact)
+    # ========================================
+    out.append("### Performance Overview")
+    out.append("")
+    out.append("| Method                   | Size    | Throughput | Msg/sec | Mean      | Ratio | Allocated | Alloc Ratio |")
+    out.append("|------------------------- |--------:|------------|--------:|----------:|------:|----------:|------------:|")
+    out.extend(overview_rows)
+    out.append("")
+
+    # ========================================
+    # Table 2: Detailed Metrics (Optional - can be toggled)
+    # ========================================
+    out.append("### Detailed Metrics")
+    out.append("")
+    out.append("| Method                   | Size    | Score (ops/s) | Error      | StdDev    | Latency   | Gen0      |")
+    out.append("|------------------------- |--------:|--------------:|-----------:|----------:|----------:|----------:|")
+    out.extend(detail_rows)
+    out.append("")
+
+    # Emit the whole section with a single write
+    sys.stdout.write("\n".join(out))
+    sys.stdout.write("\n")
 
 # Get project root directory (2 levels up from script directory)
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(os.path.dirname(script_dir))
 results_path = os.path.join(project_root, 'zmq', 'build', 'reports', 'jmh', 'results.json')
 
-# Check if file exists and is not empty
-if not os.path.exists(results_path):
+# Check if file exists and is not empty (a single stat call)
+try:
+    results_stat = os.stat(results_path)
+except FileNotFoundError:
     print(f"Error: JMH results file not found at: {results_path}", file=sys.stderr)
     print(f"Please run JMH benchmarks first using: ./gradlew jmh", file=sys.stderr)
     sys.exit(1)
 
-if os.path.getsize(results_path) == 0:
+if results_stat.st_size == 0:
     print(f"Error: JMH results file is empty: {results_path}", file=sys.stderr)
     print(f"Please run JMH benchmarks first using: ./gradlew jmh", file=sys.stderr)
     sys.exit(1)
 
-with open(results_path, 'r') as f:
-    data = json.load(f)
+with open(results_path, 'rb') as f:
+    raw_results = f.read()
+
+data = orjson.loads(raw_results) if orjson is not None else json.loads(raw_results)
 
 # Print header
-print("\n```")
-print("\nBenchmarkDotNet-style JMH Results")
-print("JMH v1.37, Ubuntu 24.04 LTS")
-print("Java HotSpot(TM) 64-Bit Server VM, JDK 22.0.2")
-print()
-print("Job=Default  Runtime=Java 22  Platform=X64")
-print("Warmup=3 iterations (2s each)  Measurement=5 iterations (5s each)")
-print()
-print("```")
+sys.stdout.write("\n".join([
+    "\n```",
+    "\nBenchmarkDotNet-style JMH Results",
+    "JMH v1.37, Ubuntu 24.04 LTS",
+    "Java HotSpot(TM) 64-Bit Server VM, JDK 22.0.2",
+    "",
+    "Job=Default  Runtime=Java 22  Platform=X64",
+    "Warmup=3 iterations (2s each)  Measurement=5 iterations (5s each)",
+    "",
+    "```",
+]))
+sys.stdout.write("\n")
+
+# Group benchmarks by type in a single pass
+groups = {'buffer': [], 'receive': []}
+for bench in data:
+    benchmark_name = bench['benchmark']
+    if 'MessageBufferStrategyBenchmark' in benchmark_name:
+        groups['buffer'].append(bench)
+    elif 'ReceiveModeBenchmark' in benchmark_name:
+        groups['receive'].append(bench)
 
 # Process both benchmark types
-process_benchmark_type(data, 'buffer')
-process_benchmark_type(data, 'receive')
+process_benchmark_type(groups['buffer'], 'buffer')
+process_benchmark_type(groups['receive'], 'receive')